@@ -1,7 +1,19 @@
+import functools
+import logging
+
 import fasttext
+import numpy as np
 
 from .text_preprocessing import TextPreprocessor
 
+log = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_model(path):
+    """Load fasttext model once per process, next calls with the same path reuse it"""
+    return fasttext.load_model(path)
+
 
 class MessageCategorizer:
     """Class to classify category of input-message, where categories = {afs, other, ps}"""
@@ -29,8 +41,8 @@ class MessageCategorizer:
             instance of TextPreprocessor to preprocess input messages with pipeline config
 
         """
-        # load model (just 2mb)
-        self.model = fasttext.load_model('project/ml/storage/message_categorizer/fasttext.ftz')
+        # load product-quantized model (.ftz, just 2mb), shared between all instances
+        self.model = _load_model('project/ml/storage/message_categorizer/fasttext.ftz')
 
         # create text preprocessor with pipeline config
         self.preprocessor = TextPreprocessor(preprocessing_pipe)
@@ -62,30 +74,57 @@ class MessageCategorizer:
 
         """
 
-        try:
-            x = self.preprocessor.preprocess(x)
-        except Exception as e:
-            print(e)
+        return self.predict_proba_batch([x])[0].tolist()
+
+    def predict_proba_batch(self, xs):
+        """Method to predict category probabilities of several messages by one fasttext call
+
+        Parameters
+        ----------
+        xs: list of str, required
+            raw messages (before preprocessing) to predict category
+
+        Returns
+        -------
+        prediction
+            2d-array of floats with shape (len(xs), 3)
+            where column indexes: 0 - afs, 1 - other, 2 - ps
+
+        Notes
+        ----------
+
+        Example input:
+
+            $ xs = ['hello xsolla, i have problems with epic store payments', 'how to buy a skin?']
+
+        Example output:
+
+            $ formatted_pred = [[0.14, 0.01, 0.85], [0.31, 0.22, 0.47]]
+
+        """
 
-        pred = self.model.predict(x, k=3)
+        xs = [self.__preprocess(x) for x in xs]
+
+        labels, probs = self.model.predict(xs, k=3)
 
         # fasttext predict has specific format: it ranged by prediction proba
         # code below transform fasttext to format [afs, other, ps] by label_mapper
-        formatted_pred = [0, 0, 0]
-        for i, label in enumerate(pred[0]):
-            # idx – correct position in array
-            # i – current position in array
-            # label – string in format __label__{afs|other|ps}
-
-            idx = self.label_mapper[label]
-            formatted_pred[idx] = pred[1][i]
+        formatted_pred = np.zeros((len(xs), len(self.label_mapper)))
+        for row, (row_labels, row_probs) in enumerate(zip(labels, probs)):
+            for label, prob in zip(row_labels, row_probs):
+                # label – string in format __label__{afs|other|ps}
+                formatted_pred[row, self.label_mapper[label]] = prob
 
         # little hack
-        max_prob = max(formatted_pred)
-
-        if max_prob > 0.5:
-            max_id = formatted_pred.index(max_prob)
-            for i, x in enumerate(formatted_pred):
-                formatted_pred[i] = 1.0 if i == max_id else 0.0
+        confident = formatted_pred.max(axis=1) > 0.5
+        formatted_pred[confident] = np.eye(len(self.label_mapper))[formatted_pred[confident].argmax(axis=1)]
 
         return formatted_pred
+
+    def __preprocess(self, x):
+        try:
+            x = self.preprocessor.preprocess(x)
+        except Exception as e:
+            log.warning('message preprocessing failed: %r', e)
+
+        return x
@@ -1,4 +1,5 @@
 import re
+import logging
 
 from langdetect import detect
 from textblob import Word, TextBlob
@@ -6,6 +7,8 @@ from nltk import word_tokenize
 
 from . import text_preprocessing_utils as utils
 
+log = logging.getLogger(__name__)
+
 # list of functions in pipe
 default_preprocessing_pipe = [
     'translate',
@@ -50,9 +53,13 @@ class TextPreprocessor:
         Attributes
         ----------
         processing_pipe : list of str
+        processing_methods : list of callable
+            methods of pipeline steps resolved once, unknown steps are skipped
 
         """
         self.processing_pipe = default_preprocessing_pipe if pipeline is None else pipeline
+        self.processing_methods = [preprocessing_mapper[step] for step in self.processing_pipe
+                                   if step in preprocessing_mapper]
 
     def preprocess(self, text):
         """Method to predict category probability of input-message, where prediction = [afs, other, ps]
@@ -76,10 +83,8 @@ class TextPreprocessor:
 
                 $ processed_text = 'hello xsolla when you send me __number__ i lost yesterday please let me know __email__'
         """
-        for step in self.processing_pipe:
-            if step in preprocessing_mapper:
-                preprocess_method = preprocessing_mapper[step]
-                text = preprocess_method(text)
+        for preprocess_method in self.processing_methods:
+            text = preprocess_method(text)
 
         return text
 
@@ -108,7 +113,7 @@ class TextPreprocessor:
             blob = TextBlob(text)
             translated = str(blob.translate())
         except Exception as e:
-            print(e)
+            log.debug('translation failed: %r', e)
             return text
 
         return translated
@@ -23,6 +23,7 @@ Using
 - create account object by passing credentials to create WorkloadScoring instance
 - read BigQuery table by ``read_table`` method passing the necessary columns to split records
 - calculate assignee workload score by ``workload_scoring`` method passing the time intervals and columns for grouping
+- or read and calculate at once by ``fetch_aggregated`` method, records are counted by BigQuery then
 - write BigQuery table by ``write_table`` method passing the columns to save as your schema supposes
 
 Example
@@ -45,10 +46,6 @@ import pandas_gbq
 
 import numpy as np
 import pandas as pd
-import math as mt
-import datetime as dt
-
-import itertools as it
 
 
 class WorkloadScoring:
@@ -71,12 +68,16 @@ class WorkloadScoring:
             result of score calculation for saving in BigQuery table
         project_id: dataframe
             GCP project_id where placed BigQuery dataset and tables
+        table_schemas: dict of str: dict
+            column dtypes of BigQuery tables already written by ``write_table``
 
         """
 
         self.raw_df = None
         self.out_df = None
 
+        self.table_schemas = {}
+
         self.project_id = credentials['project_id']
 
         self.credentials = Credentials.from_service_account_info(credentials)
@@ -92,8 +93,8 @@ class WorkloadScoring:
             period in days that used to calculate score
         num_of_interval_days: int, optional, default=7
             window that used to slide against period
-        end_date: str, optional, default='2017-04-01'
-            date of the last interval in schema 'y-m-d'
+        end_date: str or date, optional, default='2017-04-01'
+            date of the last interval in schema 'y-m-d' or date object
 
 
         Notes
@@ -101,29 +102,30 @@ class WorkloadScoring:
 
         Algorithm explanation
 
-        1) Calculate cartesian product unique values in each columns
+        1) Find combinations of values in columns which occur in records
 
         Example input:
 
         - assignee_id: [1, 2, 3]
         - country: ['usa', 'russia']
 
-        Example output:
+        Example output (assignee 3 has no records from russia):
 
-            cartesian_product = [(1, 'usa'), (1, 'russia'), (2, 'usa'), (2, 'russia'), (3, 'usa'), (3, 'russia')]
+            groups = [(1, 'usa'), (1, 'russia'), (2, 'usa'), (2, 'russia'), (3, 'usa')]
 
-        On each element of cartesian_product do 2-6
+        Each element of groups is a group of records, do 2-6 for every group
 
-        2) Get slice of dataframe based on value in tuple (e.g. assignee_id - 1, country – 'usa')
+        2) Split period into intervals counted back from end date and assign every record to its interval
 
         For example:
 
-            id      created     updated     assignee_id     country
-            1       2017-01-01  2017-04-02  1               usa
-            2       2017-01-01  2017-04-03  1               usa
+            id      created     updated     assignee_id     country     interval
+            1       2017-01-01  2017-04-02  1               usa         0
+            2       2017-01-01  2017-04-03  1               usa         0
 
-        3) For every interval in period count task was finished by assignee
+        3) For every group and interval in period count task was finished by assignee
 
+        All groups are counted at once by a single bincount over group and interval codes.
         For example end date – 2017-04-28, interval – 7 days. Possible result:
 
             completed = [
@@ -135,6 +137,9 @@ class WorkloadScoring:
 
         4) Calculate mean, std, var, ste for all intervals except the last one (2017-04-22 - 2017-04-28)
 
+        Statistics of all groups are calculated at once by numpy. Variance is taken from deviations
+        to the already known mean (two-pass), so it stays numerically stable without compiled kernels.
+
         For completed:
 
             mean – 3.00
@@ -155,77 +160,116 @@ class WorkloadScoring:
         if self.raw_df is None:
             return 'load data'
 
-        data = {
-            'score_value': [],
-            'count_last_period': [],
-            'count_sem_calc_period': [],
-            'count_mean_calc_period': []
-        }
+        end_date = pd.Timestamp(end_date).normalize()
+
+        num_of_intervals = int(num_of_all_days / num_of_interval_days)
 
-        col_unique_vals = []
-        for column in columns_list:
-            data[column] = []
+        # only combinations which really occur in data, every record gets code of its group
+        group_idx, groups = pd.MultiIndex.from_frame(self.raw_df[columns_list]).factorize()
 
-            col_unique_vals.append(self.raw_df[column].unique())
+        # the last interval ends with end_date, intervals are counted back from it
+        days_before_end = (end_date - self.raw_df.updated).dt.days.to_numpy()
+        interval_idx = num_of_intervals - 1 - days_before_end // num_of_interval_days
 
-        cartesian_product = list(it.product(*col_unique_vals))
+        in_period = (days_before_end >= 0) & (interval_idx >= 0)
 
-        for values in cartesian_product:
-            df_slice = self.__get_dataframe_slice(columns_list, values)
+        # unique tasks in every (group, interval), groups without records in period get zero counts
+        df_period = pd.DataFrame({
+            'group_idx': group_idx[in_period],
+            'interval_idx': interval_idx[in_period].astype(int),
+            'id': self.raw_df['id'].to_numpy()[in_period]
+        }).drop_duplicates()
 
-            end_date = dt.datetime.strptime(str(end_date), '%Y-%m-%d')
-            end_date = end_date.date()
+        counts = np.bincount(
+            df_period['group_idx'] * num_of_intervals + df_period['interval_idx'],
+            minlength=len(groups) * num_of_intervals
+        ).reshape(len(groups), num_of_intervals)
 
-            fst_cur_date = end_date - dt.timedelta(days=num_of_all_days)
+        self.__score_groups(columns_list, groups, counts)
 
-            delta = dt.timedelta(days=num_of_interval_days)
+    def fetch_aggregated(self, dataset_id, table_id, columns, num_of_all_days=28, num_of_interval_days=7,
+                         end_date='2017-04-01'):
+        """Calculation workload scoring on task counts aggregated by BigQuery
 
-            snd_cur_date = fst_cur_date + delta
+        Does the same as ``read_table`` followed by ``workload_scoring``, but records are grouped and
+        counted by BigQuery, so only small table of counts is downloaded instead of all records.
+
+        Parameters
+        ----------
+        dataset_id: str, required
+            BigQuery dataset_id of dataset that contains tables
+        table_id: str, required
+            BigQuery table_id which use to query data
+        columns: dict of str: list of obj, required
+            columns for grouping records and their allowed values, see ``read_table``
+        num_of_all_days: int, optional, default=28
+            period in days that used to calculate score
+        num_of_interval_days: int, optional, default=7
+            window that used to slide against period
+        end_date: str or date, optional, default='2017-04-01'
+            date of the last interval in schema 'y-m-d' or date object
 
-            num_of_intervals = int(num_of_all_days / num_of_interval_days)
-            num_tasks_per_week = []
+        Notes
+        ----------
 
-            for i in range(0, num_of_intervals):
-                df_interval = df_slice[
-                    (df_slice.updated >= str(fst_cur_date)) & (df_slice.updated <= str(snd_cur_date))]
+        Unlike ``workload_scoring`` groups without records in period are not present in result.
 
-                fst_cur_date = fst_cur_date + delta
-                snd_cur_date = snd_cur_date + delta
+        Example
 
-                if i != (num_of_intervals - 1):
-                    num_of_tasks = len(np.unique(df_interval['id']))
-                    num_tasks_per_week.append(num_of_tasks)  # history number of tasks
-                else:
-                    num_tasks_per_current_week = len(np.unique(df_interval['id']))  # currently number of tasks
+        Input parameters:
 
-            avg_num_of_task_per_week = round(np.mean(num_tasks_per_week), 2)
+        - dataset_id = 'dataset'
+        - table_id = 'table'
+        - columns = {'assignee_id': [], 'status': ['closed', 'solved']}
+        - num_of_all_days = 28, num_of_interval_days = 7, end_date = '2017-04-28'
 
-            # TODO: rewrite score calculation logic as interface->class->object
+        Query counts unique tasks in every group and interval counted back from end date:
 
-            x_values = []
-            for num in num_tasks_per_week:
-                x = round((num - avg_num_of_task_per_week) ** 2, 2)
-                x_values.append(x)
+            select assignee_id, status,
+                div(date_diff(date '2017-04-28', date(cast(updated_at as datetime)), day), 7) as interval_back,
+                count(distinct id) as num_of_tasks
+            from `dataset.table`
+            where date(cast(updated_at as datetime)) between date '2017-04-01' and date '2017-04-28'
+                and status in unnest(@status_values)
+            group by assignee_id, status, interval_back
 
-            x_sum = round(sum(x_values), 2)
-            var = round(x_sum / (num_of_intervals - 1), 2)
-            std = round(mt.sqrt(var), 2)
-            ste = round(std / mt.sqrt(num_of_intervals), 2)
+        """
+        columns_list = list(columns.keys())
 
-            left_border = int(avg_num_of_task_per_week - ste)
-            right_border = int(avg_num_of_task_per_week + ste)
+        end_date = pd.Timestamp(end_date).normalize()
 
-            score_value = self.__calc_workload_score(left_border, right_border, num_tasks_per_current_week)
+        num_of_intervals = int(num_of_all_days / num_of_interval_days)
 
-            data['score_value'].append(score_value)
-            data['count_last_period'].append(num_tasks_per_current_week)
-            data['count_sem_calc_period'].append(ste)
-            data['count_mean_calc_period'].append(avg_num_of_task_per_week)
+        fst_date = end_date - pd.Timedelta(days=num_of_intervals * num_of_interval_days - 1)
 
-            for i, column in enumerate(columns_list):
-                data[column].append(values[i])
+        updated = "date(cast(updated_at as datetime))"
+        where_statement, query_parameters = self.__get_where_statement(columns)
+        where_statement = [
+            f"{updated} between date '{fst_date:%Y-%m-%d}' and date '{end_date:%Y-%m-%d}'"
+        ] + where_statement
 
-        self.out_df = pd.DataFrame(data=data)
+        bigquery_sql = " ".join([
+            f"select {', '.join(columns_list)},",
+            f"div(date_diff(date '{end_date:%Y-%m-%d}', {updated}, day), {num_of_interval_days}) as interval_back,",
+            "count(distinct id) as num_of_tasks",
+            f"from `{dataset_id}.{table_id}`",
+            "where " + " and ".join(where_statement),
+            f"group by {', '.join(columns_list)}, interval_back"
+        ])
+
+        agg_df = pandas_gbq.read_gbq(
+            bigquery_sql,
+            project_id=self.project_id,
+            configuration=self.__get_query_configuration(query_parameters)
+        )
+
+        group_idx, groups = pd.MultiIndex.from_frame(agg_df[columns_list]).factorize()
+        interval_idx = num_of_intervals - 1 - agg_df['interval_back'].to_numpy().astype(int)
+
+        counts = np.zeros((len(groups), num_of_intervals), dtype=int)
+        counts[group_idx, interval_idx] = agg_df['num_of_tasks'].to_numpy()
+
+        self.__score_groups(columns_list, groups, counts)
 
     def read_table(self, dataset_id, table_id, columns):
         """Loading table data from BigQuery for workload scoring model
@@ -283,9 +327,9 @@ class WorkloadScoring:
 
             BASE_SELECT, assignee_id, country
 
-        WHERE statement:
+        WHERE statement, values are passed as query parameter @country_values = ['usa', 'russia']:
 
-            where country in ('usa', 'russia')
+            where country in unnest(@country_values)
 
         Possible output:
 
@@ -296,6 +340,7 @@ class WorkloadScoring:
 
         """
         where_statement = []
+        query_parameters = []
         from_statement = f"from `{dataset_id}.{table_id}`"
         select_statement = "select id, date(cast(created_at as datetime)) as created, " \
                            "date(cast(updated_at as datetime)) as updated"
@@ -303,12 +348,9 @@ class WorkloadScoring:
         if columns is not None:
             select_statement = select_statement + ", " + ", ".join(columns.keys())
 
-            for c, v in columns.items():
-                if len(v) > 0:
-                    val_enum = ", ".join([f"'{x}'" for x in v])
-                    where_statement.append(f'{c} in ({val_enum})')
+            where_statement, query_parameters = self.__get_where_statement(columns)
 
-        where_statement = "where " + ", ".join(where_statement) if len(where_statement) > 0 else ""
+        where_statement = "where " + " and ".join(where_statement) if len(where_statement) > 0 else ""
 
         bigquery_sql = " ".join([
             select_statement,
@@ -319,9 +361,14 @@ class WorkloadScoring:
 
         self.raw_df = pandas_gbq.read_gbq(
             bigquery_sql,
-            project_id=self.project_id
+            project_id=self.project_id,
+            configuration=self.__get_query_configuration(query_parameters)
         )
 
+        # cast dates to datetime64 once, scoring compares them without parsing
+        self.raw_df['created'] = pd.to_datetime(self.raw_df['created'])
+        self.raw_df['updated'] = pd.to_datetime(self.raw_df['updated'])
+
     def write_table(self, dataset_id, table_id, dev_name='default.developer', columns=None):
         """Writing scoring data to BigQuery table
 
@@ -369,21 +416,16 @@ class WorkloadScoring:
 
         destination_table = f"{dataset_id}.{table_id}"
 
-        insert_df = pd.DataFrame()
-
         if columns is None:
             columns = self.out_df.columns
 
-        column2type = dict(pandas_gbq.read_gbq(
-            f"select {', '.join(columns)} from `{destination_table}` limit 0",
-            project_id=self.project_id
-        ).dtypes)
+        column2type = self.__get_table_schema(destination_table)
 
-        for col in columns:
-            insert_df[col] = self.out_df[col].astype(column2type[col])
+        # cast all columns first and build insert_df at once instead of inserting column by column
+        insert_data = {col: self.out_df[col].astype(column2type[col]) for col in columns}
+        insert_data['developer'] = str(dev_name)
 
-        insert_df['developer'] = dev_name
-        insert_df['developer'] = insert_df['developer'].astype('str')
+        insert_df = pd.DataFrame(insert_data)
 
         pandas_gbq.to_gbq(
             insert_df,
@@ -392,23 +434,98 @@ class WorkloadScoring:
             if_exists='append'
         )
 
-    def __get_dataframe_slice(self, columns, values):
-        mask = True
+    @staticmethod
+    def __get_where_statement(columns):
+        # values are sent as named array parameters, so they are never interpolated into sql
+        where_statement = []
+        query_parameters = []
+
+        for c, v in columns.items():
+            if len(v) > 0:
+                if all(isinstance(x, (bool, np.bool_)) for x in v):
+                    value_type = 'BOOL'
+                elif all(isinstance(x, (int, np.integer)) for x in v):
+                    value_type = 'INT64'
+                elif all(isinstance(x, (int, float, np.number)) for x in v):
+                    value_type = 'FLOAT64'
+                else:
+                    value_type = 'STRING'
 
-        for i, col in enumerate(columns):
-            mask = mask & (self.raw_df[col] == values[i])
+                where_statement.append(f'{c} in unnest(@{c}_values)')
+                query_parameters.append({
+                    'name': f'{c}_values',
+                    'parameterType': {'type': 'ARRAY', 'arrayType': {'type': value_type}},
+                    'parameterValue': {'arrayValues': [
+                        {'value': str(x).lower() if value_type == 'BOOL' else str(x)} for x in v
+                    ]}
+                })
 
-        return self.raw_df[mask]
+        return where_statement, query_parameters
+
+    @staticmethod
+    def __get_query_configuration(query_parameters):
+        # the same parameterized query text lets BigQuery reuse cached results
+        return {
+            'query': {
+                'useQueryCache': True,
+                'parameterMode': 'NAMED',
+                'queryParameters': query_parameters
+            }
+        }
+
+    def __get_table_schema(self, destination_table):
+        # schema is requested once per table, next writes reuse cached dtypes
+        if destination_table not in self.table_schemas:
+            self.table_schemas[destination_table] = dict(pandas_gbq.read_gbq(
+                f"select * from `{destination_table}` limit 0",
+                project_id=self.project_id
+            ).dtypes)
+
+        return self.table_schemas[destination_table]
+
+    def __score_groups(self, columns_list, groups, counts):
+        num_of_intervals = counts.shape[1]
+
+        num_tasks_per_week = counts[:, :-1]  # history number of tasks
+        num_tasks_per_current_week = counts[:, -1]  # currently number of tasks
+
+        # TODO: rewrite score calculation logic as interface->class->object
+
+        # statistics are calculated for all groups at once, each row is history of one group
+        avg_num_of_task_per_week = num_tasks_per_week.mean(axis=1)
+        var = num_tasks_per_week.var(axis=1)
+        std = np.sqrt(var)
+        ste = std / np.sqrt(num_of_intervals)
+
+        avg_num_of_task_per_week = np.round(avg_num_of_task_per_week, 2)
+        ste = np.round(ste, 2)
+
+        left_border = (avg_num_of_task_per_week - ste).astype(int)
+        right_border = (avg_num_of_task_per_week + ste).astype(int)
+
+        score_value = self.__calc_workload_score(left_border, right_border, num_tasks_per_current_week)
+
+        data = {
+            'score_value': score_value,
+            'count_last_period': num_tasks_per_current_week,
+            'count_sem_calc_period': ste,
+            'count_mean_calc_period': avg_num_of_task_per_week
+        }
+
+        for i, column in enumerate(columns_list):
+            data[column] = groups.get_level_values(i)
+
+        self.out_df = pd.DataFrame(data=data)
 
     @staticmethod
     def __calc_workload_score(left_board, right_board, current_num_of_tasks):
-        if (left_board == 0) & (current_num_of_tasks == 0) & (right_board == 0):
-            score = 0
-        elif (current_num_of_tasks >= 0) & (current_num_of_tasks < left_board):
-            score = 0
-        elif (current_num_of_tasks >= left_board) & (current_num_of_tasks <= right_board):
-            score = 1
-        else:
-            score = 2
+        # 0 – below confidence interval, 1 – inside, 2 – above; all arguments are arrays over groups
+        score = np.where(
+            current_num_of_tasks < left_board, 0,
+            np.where(current_num_of_tasks <= right_board, 1, 2)
+        )
+
+        # group without any tasks is not loaded at all
+        score[(left_board == 0) & (current_num_of_tasks == 0) & (right_board == 0)] = 0
 
         return score